@@ -0,0 +1,69 @@
+import argparse
+import os
+import time
+
+import numpy as np
+
+import detection
+
+# 合成团伙的特征范围 (与generate_data.py中第一个团伙一致)，每个团伙再乘以各自的尺度系数
+LEADER_RANGES = [(0.3, 1.5), (1, 3), (8000, 15000), (5, 20)]
+MEAT_MACHINE_RANGES = [(4, 7), (10, 15), (100, 800), (60, 90)]
+
+# 默认测试的(团伙数量, 每个团伙的设备数量)组合
+DEFAULT_CASES = [(3, 200), (50, 200), (200, 200), (500, 100), (200, 1000), (500, 1000)]
+
+
+def synthetic_gangs(n_gangs, gang_size, seed=42):
+    """生成多个团伙的特征矩阵和团伙编号，每个团伙有自己的特征尺度，约5%的设备为leader"""
+    rng = np.random.default_rng(seed)
+    blocks = []
+    for _ in range(n_gangs):
+        scale = rng.uniform(0.5, 3, size=len(LEADER_RANGES))
+        leader_count = max(1, int(gang_size * 0.05))
+        for ranges, count in ((LEADER_RANGES, leader_count), (MEAT_MACHINE_RANGES, gang_size - leader_count)):
+            low, high = np.array(ranges).T
+            blocks.append(rng.uniform(low, high, size=(count, len(ranges))) * scale)
+    X = np.concatenate(blocks)
+    gangs = np.repeat([f"gang_{g}" for g in range(n_gangs)], gang_size).astype(object)
+    return X, gangs
+
+
+def best_time(func, repeats):
+    """多次运行取最短耗时"""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def global_fit(X):
+    """全局聚类 (analyze_groups.py的默认方式)"""
+    labels = detection.cluster_features(X, detection.N_CLUSTERS)
+    return labels, detection.identify_cluster_types(X, labels)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较全局K-means与分团伙局部聚类的运行时间")
+    parser.add_argument('--cases', nargs='*', default=None, metavar='GANGSxSIZE',
+                        help="测试组合，例如 50x200 500x100，默认测试DEFAULT_CASES")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="局部聚类的工作进程数")
+    parser.add_argument('--repeats', type=int, default=3, help="每种方式的重复运行次数")
+    args = parser.parse_args()
+
+    cases = [tuple(int(v) for v in case.split('x')) for case in args.cases] if args.cases else DEFAULT_CASES
+    print(f"工作进程数: {args.workers}")
+    print(f"{'团伙数 x 规模':>14} {'全局':>8} {'局部(串行)':>10} {'局部(并行)':>10} {'加速比':>8}")
+    for n_gangs, gang_size in cases:
+        X, gangs = synthetic_gangs(n_gangs, gang_size)
+        global_time = best_time(lambda: global_fit(X), args.repeats)
+        serial_time = best_time(lambda: detection.cluster_by_gang(X, gangs, workers=1), args.repeats)
+        parallel_time = best_time(lambda: detection.cluster_by_gang(X, gangs, workers=args.workers), args.repeats)
+        print(f"{f'{n_gangs} x {gang_size}':>14} {global_time:>7.2f}s {serial_time:>9.2f}s "
+              f"{parallel_time:>9.2f}s {global_time / parallel_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+from threadpoolctl import threadpool_limits
+
+# 用于聚类的特征
+FEATURES = ['screen_time', 'trade_freq', 'trade_amount', 'app_switches']
+
+# 生产环境使用的检测参数
+SUBNET_THRESHOLD = 20   # 同一子网下IMEI数量超过该值视为可疑子网
+IP_SHARE_MIN = 2        # 共用同一公网IP的设备数量达到该值视为可疑
+N_CLUSTERS = 3          # K-means聚类数量
+FREQ_TOLERANCE = 2      # 肉机交易频率与各聚类交易频率中位数的最大偏差
+LEADER_MIN_IPS = 2      # leader至少使用的IP数量
+MIN_GANG_SIZE = 10      # 分团伙聚类时，小于该规模的团伙合并到OTHER_GANG中一起聚类
+LOCAL_N_INIT = 3        # 分团伙聚类时每个团伙的K-means初始化次数，团伙内数据规模小，3次已足够稳定
+LOCAL_MAX_ITER = 100    # 分团伙聚类时Lloyd迭代的最大次数
+LOCAL_TOL = 1e-4        # 分团伙聚类时聚类中心移动距离平方和的收敛阈值 (标准化后的特征)
+SKLEARN_GANG_SIZE = 20000  # 设备数量不少于该值的团伙单独用sklearn的KMeans聚类，其余团伙合并后用numpy批量聚类
+BATCHES_PER_WORKER = 4  # 分团伙聚类时每个工作进程分到的任务批数
+
+PRODUCTION_PARAMS = {
+    'subnet_threshold': SUBNET_THRESHOLD,
+    'ip_share_min': IP_SHARE_MIN,
+    'n_clusters': N_CLUSTERS,
+    'freq_tolerance': FREQ_TOLERANCE,
+    'leader_min_ips': LEADER_MIN_IPS,
+}
+
+LEADER = "重大leader"
+MEAT_MACHINE = "肉机"
+NOISE = "误差项"
+OTHER_GANG = "其他"
+
+
+def _group_sizes(codes):
+    """返回每条记录所在分组的记录数，缺失值(pd.factorize编码为-1)的记录不计入分组，返回0"""
+    valid = codes >= 0
+    counts = np.bincount(codes[valid], minlength=1)
+    return np.where(valid, counts[np.where(valid, codes, 0)], 0)
+
+
+def suspicious_masks(subnet_codes, ip_codes, subnet_threshold=SUBNET_THRESHOLD, ip_share_min=IP_SHARE_MIN):
+    """根据子网和公网IP编码返回(可疑子网掩码, 共用IP掩码)，子网或IP缺失的记录不因该项被视为可疑"""
+    subnet_mask = _group_sizes(subnet_codes) > subnet_threshold
+    ip_mask = _group_sizes(ip_codes) >= max(ip_share_min, 1)
+    return subnet_mask, ip_mask
+
+
+def suspicious_devices_mask(df, subnet_threshold=SUBNET_THRESHOLD, ip_share_min=IP_SHARE_MIN):
+    """返回(可疑设备掩码, 可疑子网掩码)。可疑设备为可疑子网下的设备和公网IP一致的设备，完全重复的记录只保留第一条"""
+    subnet_mask, ip_mask = suspicious_masks(pd.factorize(df['subnet'])[0], pd.factorize(df['ip'])[0],
+                                            subnet_threshold, ip_share_min)
+    return (subnet_mask | ip_mask) & ~df.duplicated().values, subnet_mask
+
+
+def cluster_features(X, n_clusters=N_CLUSTERS, random_state=42, n_init=10):
+    """标准化特征后执行K-means聚类，返回聚类标签"""
+    X_scaled = StandardScaler().fit_transform(X)
+    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=n_init)
+    return kmeans.fit_predict(X_scaled)
+
+
+def identify_cluster_types(X, labels, freq_tolerance=FREQ_TOLERANCE):
+    """根据各聚类的交易频率和交易金额均值识别设备类型
+
+    X的列顺序与FEATURES一致。交易频率低于各聚类均值且交易金额高于各聚类均值的设备为leader，
+    交易频率接近各聚类中位数且交易金额较低的设备为肉机，其余为误差项。
+    """
+    trade_freq, trade_amount = X[:, 1], X[:, 2]
+    cluster_ids = np.unique(labels)
+    freq_means = np.array([trade_freq[labels == c].mean() for c in cluster_ids])
+    amount_means = np.array([trade_amount[labels == c].mean() for c in cluster_ids])
+
+    freq_mean, freq_median, amount_mean = freq_means.mean(), np.median(freq_means), amount_means.mean()
+    is_leader = (trade_freq < freq_mean) & (trade_amount > amount_mean)
+    is_meat = ~is_leader & (np.abs(trade_freq - freq_median) < freq_tolerance) & (trade_amount < amount_mean)
+    return np.where(is_leader, LEADER, np.where(is_meat, MEAT_MACHINE, NOISE))
+
+
+def device_ip_counts(imei_codes, ip_codes):
+    """计算每条记录对应IMEI使用过的不同IP数量，IMEI或IP缺失(编码为-1)的记录不计入"""
+    valid = (imei_codes >= 0) & (ip_codes >= 0)
+    pairs = np.unique(np.stack([imei_codes[valid], ip_codes[valid]], axis=1), axis=0)
+    counts = np.bincount(pairs[:, 0], minlength=imei_codes.max(initial=0) + 1)
+    return np.where(imei_codes >= 0, counts[np.where(imei_codes >= 0, imei_codes, 0)], 0)
+
+
+def gang_keys(subnets, ips, in_suspicious_subnet, min_size=MIN_GANG_SIZE):
+    """为可疑设备划分团伙：可疑子网内的设备按子网划分，仅因共用IP而可疑的设备按IP划分，过小的团伙合并为OTHER_GANG"""
+    keys = np.where(in_suspicious_subnet, subnets, ips).astype(object)
+    _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+    keys[counts[inverse] < min_size] = OTHER_GANG
+    return keys
+
+
+def _limit_threads():
+    """工作进程初始化：每个进程只用一个计算线程，避免与进程池争抢CPU"""
+    global _thread_limits
+    _thread_limits = threadpool_limits(1)
+
+
+def _segment_sums(gang_ids, rows, n_gangs):
+    """按团伙编号对rows (特征, 设备) 的每一行求和，返回(n_gangs, 特征数)"""
+    return np.stack([np.bincount(gang_ids, row, minlength=n_gangs) for row in rows], axis=1)
+
+
+def _squared_distances(XT, center, counts):
+    """计算每个设备到所在团伙某个聚类中心的距离平方
+
+    XT按(特征, 设备)排列且设备按团伙连续存放，center为(团伙数, 特征数)，counts为各团伙的设备数。
+    逐特征做一维运算并复用临时数组，比构造(设备, 聚类, 特征)的三维数组快得多。
+    """
+    distances = np.subtract(XT[0], np.repeat(center[:, 0], counts))
+    distances *= distances
+    diff = np.empty_like(distances)
+    for f in range(1, len(XT)):
+        np.subtract(XT[f], np.repeat(center[:, f], counts), out=diff)
+        diff *= diff
+        distances += diff
+    return distances
+
+
+def _nearest_centers(XT, centers, counts):
+    """返回每个设备在所在团伙内最近的聚类中心编号及其距离平方，centers为(团伙数, 聚类数, 特征数)"""
+    labels = np.zeros(XT.shape[1], dtype=int)
+    closest = _squared_distances(XT, centers[:, 0], counts)
+    for c in range(1, centers.shape[1]):
+        distances = _squared_distances(XT, centers[:, c], counts)
+        labels[distances < closest] = c
+        np.minimum(closest, distances, out=closest)
+    return labels, closest
+
+
+def _batched_kmeans(X, counts, uniforms, n_clusters, n_init):
+    """对多个团伙同时执行K-means (k-means++初始化 + Lloyd迭代)
+
+    X按团伙连续排列，counts为各团伙的设备数 (均不少于n_clusters)。每个团伙独立标准化，
+    所有团伙的距离计算和中心更新合并成一次numpy运算，避免逐个团伙调用sklearn的固定开销；
+    已收敛 (聚类编号不再变化或中心移动小于LOCAL_TOL) 的团伙退出后续迭代。
+    uniforms[g, i, j]是第g个团伙第i次初始化选第j个中心用的随机数。返回各设备在团伙内的聚类编号。
+    """
+    n_gangs, k, n_points = len(counts), n_clusters, len(X)
+    gang_ids = np.repeat(np.arange(n_gangs), counts)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    # 与StandardScaler一致：按团伙减均值、除以标准差，标准差接近0的特征不缩放
+    XT = np.ascontiguousarray(X.T, dtype=float)
+    mean = _segment_sums(gang_ids, XT, n_gangs) / counts[:, None]
+    XT -= np.repeat(mean.T, counts, axis=1)
+    std = np.sqrt(_segment_sums(gang_ids, XT ** 2, n_gangs) / counts[:, None])
+    std[std < 10 * np.finfo(float).eps] = 1.0
+    XT /= np.repeat(std.T, counts, axis=1)
+
+    best_labels = np.zeros(n_points, dtype=int)
+    best_inertia = np.full(n_gangs, np.inf)
+    for init in range(n_init):
+        # k-means++：第一个中心在团伙内均匀抽取，之后按到已选中心的距离平方加权抽取
+        centers = np.empty((n_gangs, k, len(XT)))
+        centers[:, 0] = XT[:, starts + (uniforms[:, init, 0] * counts).astype(int)].T
+        closest = _squared_distances(XT, centers[:, 0], counts)
+        for c in range(1, k):
+            cumulative = np.cumsum(closest)
+            before = np.concatenate([[0.0], cumulative])[starts]
+            totals = np.bincount(gang_ids, closest, minlength=n_gangs)
+            picks = np.searchsorted(cumulative, before + uniforms[:, init, c] * totals, side='right')
+            centers[:, c] = XT[:, np.clip(picks, starts, starts + counts - 1)].T
+            np.minimum(closest, _squared_distances(XT, centers[:, c], counts), out=closest)
+
+        labels = np.full(n_points, -1)
+        points = np.arange(n_points)
+        active = np.ones(n_gangs, dtype=bool)
+        for _ in range(LOCAL_MAX_ITER):
+            point_gangs = gang_ids[points]
+            point_XT = XT[:, points]
+            new_labels, _ = _nearest_centers(point_XT, centers[active], counts[active])
+            changed = np.bincount(point_gangs, new_labels != labels[points], minlength=n_gangs) > 0
+            labels[points] = new_labels
+
+            # 只有仍在迭代的团伙的中心会被更新，空聚类保留原中心
+            slots = point_gangs * k + new_labels
+            sizes = np.bincount(slots, minlength=n_gangs * k)
+            filled = sizes > 0
+            new_centers = centers.reshape(n_gangs * k, -1).copy()
+            new_centers[filled] = _segment_sums(slots, point_XT, n_gangs * k)[filled] / sizes[filled, None]
+            new_centers = new_centers.reshape(centers.shape)
+            shift = ((new_centers - centers) ** 2).sum(axis=(1, 2))
+            centers = new_centers
+
+            active &= changed & (shift > LOCAL_TOL)
+            if not active.any():
+                break
+            points = points[active[point_gangs]]
+
+        labels, closest = _nearest_centers(XT, centers, counts)
+        inertia = np.bincount(gang_ids, closest, minlength=n_gangs)
+        better = inertia < best_inertia
+        best_inertia = np.where(better, inertia, best_inertia)
+        best_labels = np.where(better[gang_ids], labels, best_labels)
+    return best_labels
+
+
+def _identify_types_by_gang(X, counts, labels, n_clusters, freq_tolerance):
+    """按团伙批量执行identify_cluster_types的判定规则"""
+    n_gangs, k = len(counts), n_clusters
+    gang_ids = np.repeat(np.arange(n_gangs), counts)
+    slots = gang_ids * k + labels
+    sizes = np.bincount(slots, minlength=n_gangs * k).reshape(n_gangs, k)
+    # 空聚类记为NaN，不参与均值和中位数
+    with np.errstate(invalid='ignore', divide='ignore'):
+        freq_means = np.bincount(slots, X[:, 1], minlength=n_gangs * k).reshape(n_gangs, k) / sizes
+        amount_means = np.bincount(slots, X[:, 2], minlength=n_gangs * k).reshape(n_gangs, k) / sizes
+    freq_means[sizes == 0] = np.nan
+    amount_means[sizes == 0] = np.nan
+
+    freq_mean = np.nanmean(freq_means, axis=1)[gang_ids]
+    freq_median = np.nanmedian(freq_means, axis=1)[gang_ids]
+    amount_mean = np.nanmean(amount_means, axis=1)[gang_ids]
+    trade_freq, trade_amount = X[:, 1], X[:, 2]
+    is_leader = (trade_freq < freq_mean) & (trade_amount > amount_mean)
+    is_meat = ~is_leader & (np.abs(trade_freq - freq_median) < freq_tolerance) & (trade_amount < amount_mean)
+    return np.where(is_leader, LEADER, np.where(is_meat, MEAT_MACHINE, NOISE))
+
+
+def _cluster_gang_batch(Xs, uniforms, n_clusters, freq_tolerance, n_init):
+    """在一个任务中处理一批团伙，返回每个团伙的(局部聚类编号, 设备类型)
+
+    设备数不足n_clusters的团伙全部记为误差项；大团伙用sklearn的KMeans逐个聚类；其余团伙合并后批量聚类。
+    """
+    results = [None] * len(Xs)
+    small = []
+    for position, X in enumerate(Xs):
+        if len(X) < n_clusters:
+            results[position] = (np.zeros(len(X), dtype=int), np.full(len(X), NOISE))
+        elif len(X) >= SKLEARN_GANG_SIZE:
+            labels = cluster_features(X, n_clusters, n_init=n_init)
+            results[position] = (labels, identify_cluster_types(X, labels, freq_tolerance))
+        else:
+            small.append(position)
+
+    if small:
+        X = np.concatenate([Xs[position] for position in small])
+        counts = np.array([len(Xs[position]) for position in small])
+        labels = _batched_kmeans(X, counts, uniforms[small], n_clusters, n_init)
+        types = _identify_types_by_gang(X, counts, labels, n_clusters, freq_tolerance)
+        bounds = np.cumsum(counts)[:-1]
+        for position, gang_labels, gang_types in zip(small, np.split(labels, bounds), np.split(types, bounds)):
+            results[position] = (gang_labels, gang_types)
+    return results
+
+
+def _balanced_batches(sizes, n_batches):
+    """按设备数量把团伙编号分成n_batches批：从大到小依次放入当前设备数最少的批"""
+    batches = [[] for _ in range(n_batches)]
+    loads = np.zeros(n_batches, dtype=int)
+    for gang in np.argsort(-np.asarray(sizes), kind='stable'):
+        target = int(np.argmin(loads))
+        batches[target].append(int(gang))
+        loads[target] += sizes[gang]
+    return [batch for batch in batches if batch]
+
+
+def cluster_by_gang(X, gangs, n_clusters=N_CLUSTERS, freq_tolerance=FREQ_TOLERANCE, workers=None,
+                    n_init=LOCAL_N_INIT, random_state=42):
+    """按团伙分区，对每个团伙独立标准化和聚类
+
+    团伙按设备数量均衡地分成若干批，每批内的团伙合并成一次批量K-means，workers大于1时各批在进程池中并行。
+    每个团伙的随机数按团伙预先生成，结果与批次划分和工作进程数无关。第g个团伙的局部聚类编号加上
+    g * n_clusters后作为全局聚类编号，设备类型按团伙内各聚类的特征判定。返回(全局聚类编号, 设备类型)。
+    """
+    gang_codes, _ = pd.factorize(gangs, sort=True)
+    counts = np.bincount(gang_codes)
+    parts = np.split(np.argsort(gang_codes, kind='stable'), np.cumsum(counts)[:-1])
+    uniforms = np.random.default_rng(random_state).random((len(parts), n_init, n_clusters))
+    workers = workers or os.cpu_count() or 1
+
+    batches = _balanced_batches(counts, 1 if workers == 1 else min(len(parts), workers * BATCHES_PER_WORKER))
+    args = ([[X[parts[gang]] for gang in batch] for batch in batches], [uniforms[batch] for batch in batches],
+            repeat(n_clusters), repeat(freq_tolerance), repeat(n_init))
+    if len(batches) == 1:
+        results = list(map(_cluster_gang_batch, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(batches)), initializer=_limit_threads) as pool:
+            results = list(pool.map(_cluster_gang_batch, *args))
+
+    labels = np.empty(len(X), dtype=int)
+    types = np.empty(len(X), dtype=object)
+    for batch, batch_results in zip(batches, results):
+        for gang, (local_labels, local_types) in zip(batch, batch_results):
+            labels[parts[gang]] = local_labels + gang * n_clusters
+            types[parts[gang]] = local_types
+    return labels, types
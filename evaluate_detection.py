@@ -0,0 +1,203 @@
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+import detection
+import result_store
+
+# 设置数据和结果路径
+DATA_DIR = "/mnt/ymj/vivo/群控/data"
+RESULT_DIR = "/mnt/ymj/vivo/群控/result"
+
+# 参数网格
+PARAM_GRID = {
+    'subnet_threshold': [10, 20, 40],
+    'ip_share_min': [2, 3, 5],
+    'n_clusters': [2, 3, 4, 5],
+    'freq_tolerance': [1, 2, 3],
+    'leader_min_ips': [1, 2],
+}
+
+# 真实角色 (generate_data.py中的role去掉团伙编号)
+ROLES = ['leader', 'meat_machine', 'normal']
+LEADER, MEAT_MACHINE, NORMAL = range(len(ROLES))
+
+# 工作进程中挂载的共享内存
+_shared = {}
+
+
+def _share(array):
+    """把数组复制到一块共享内存中，返回(共享内存, 挂载参数)"""
+    shm = shared_memory.SharedMemory(create=True, size=array.nbytes)
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[:] = array
+    return shm, (shm.name, array.shape, array.dtype.str)
+
+
+def _attach(features_spec, codes_spec):
+    """工作进程初始化：挂载特征矩阵和编码矩阵，并限制每个进程只用一个计算线程"""
+    for key, (name, shape, dtype) in (('features', features_spec), ('codes', codes_spec)):
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key + '_shm'] = shm
+        _shared[key] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+    _shared['limits'] = threadpool_limits(1)
+
+
+def load_matrices(data_path):
+    """读取设备数据，返回特征矩阵和(子网, IP, IMEI, 真实角色)编码矩阵"""
+    df = pd.read_csv(data_path, dtype={'imei': str})
+    roles = df['role'].str.replace(r'_group_\d+$', '', regex=True)
+    codes = np.stack([
+        pd.factorize(df['subnet'])[0],
+        pd.factorize(df['ip'])[0],
+        pd.factorize(df['imei'])[0],
+        roles.map(ROLES.index).values,
+    ], axis=1).astype(np.int64)
+    features = np.ascontiguousarray(df[detection.FEATURES].values, dtype=np.float64)
+    return features, codes
+
+
+def predict_roles(X, codes, params):
+    """按给定参数运行检测流程，返回每条记录的预测角色编码"""
+    subnet_mask, ip_mask = detection.suspicious_masks(
+        codes[:, 0], codes[:, 1], params['subnet_threshold'], params['ip_share_min'])
+    idx = np.flatnonzero(subnet_mask | ip_mask)
+    predicted = np.full(len(X), NORMAL)
+    if len(idx) < params['n_clusters']:
+        return predicted
+
+    X_suspicious = X[idx]
+    labels = detection.cluster_features(X_suspicious, params['n_clusters'])
+    types = detection.identify_cluster_types(X_suspicious, labels, params['freq_tolerance'])
+    ip_count = detection.device_ip_counts(codes[idx, 2], codes[idx, 1])
+    predicted[idx[(types == detection.LEADER) & (ip_count >= params['leader_min_ips'])]] = LEADER
+    predicted[idx[types == detection.MEAT_MACHINE]] = MEAT_MACHINE
+    return predicted
+
+
+def role_scores(truth, predicted):
+    """计算各角色的precision/recall/F1以及宏平均F1"""
+    scores = {}
+    f1_values = []
+    for code, role in enumerate(ROLES):
+        tp = np.sum((predicted == code) & (truth == code))
+        fp = np.sum((predicted == code) & (truth != code))
+        fn = np.sum((predicted != code) & (truth == code))
+        precision = tp / (tp + fp) if tp + fp else 0.0
+        recall = tp / (tp + fn) if tp + fn else 0.0
+        f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+        scores[f'{role}_precision'] = precision
+        scores[f'{role}_recall'] = recall
+        scores[f'{role}_f1'] = f1
+        f1_values.append(f1)
+    scores['macro_f1'] = float(np.mean(f1_values))
+    return scores
+
+
+def evaluate_setting(params, repeats=3):
+    """在工作进程中评估一组参数，运行时间取多次运行的最小值"""
+    X, codes = _shared['features'], _shared['codes']
+    runtimes = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        predicted = predict_roles(X, codes, params)
+        runtimes.append(time.perf_counter() - start)
+    result = dict(params)
+    result.update(role_scores(codes[:, 3], predicted))
+    result['runtime'] = min(runtimes)
+    return result
+
+
+def parameter_grid(grid=PARAM_GRID):
+    """展开参数网格，生产环境参数总是包含在内"""
+    keys = list(grid)
+    settings = [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+    if detection.PRODUCTION_PARAMS not in settings:
+        settings.append(dict(detection.PRODUCTION_PARAMS))
+    return settings
+
+
+def mark_pareto(results):
+    """标记检测质量(宏平均F1)与运行时间上的帕累托最优设置"""
+    ordered = results.sort_values(['runtime', 'macro_f1'], ascending=[True, False])
+    best_f1 = -np.inf
+    pareto = pd.Series(False, index=results.index)
+    for index, f1 in ordered['macro_f1'].items():
+        if f1 > best_f1:
+            pareto[index] = True
+            best_f1 = f1
+    results['pareto'] = pareto
+    return results
+
+
+def run_sweep(data_path, workers=None, repeats=3):
+    """在进程池中并行评估整个参数网格"""
+    features, codes = load_matrices(data_path)
+    features_shm, features_spec = _share(features)
+    codes_shm, codes_spec = _share(codes)
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_attach,
+                                 initargs=(features_spec, codes_spec)) as pool:
+            settings = parameter_grid()
+            rows = list(pool.map(evaluate_setting, settings, itertools.repeat(repeats)))
+    finally:
+        for shm in (features_shm, codes_shm):
+            shm.close()
+            shm.unlink()
+
+    results = pd.DataFrame(rows)
+    production = pd.Series(True, index=results.index)
+    for key, value in detection.PRODUCTION_PARAMS.items():
+        production &= results[key] == value
+    results['production'] = production
+    return mark_pareto(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用generate_data.py生成的真实角色评估检测参数")
+    parser.add_argument('--data', default=os.path.join(DATA_DIR, 'device_data.csv'), help="设备数据路径")
+    parser.add_argument('--workers', type=int, default=None, help="工作进程数，默认为CPU核数")
+    parser.add_argument('--repeats', type=int, default=3, help="每组参数的重复运行次数")
+    args = parser.parse_args()
+
+    print(f"正在评估{len(parameter_grid())}组检测参数...")
+    results = run_sweep(args.data, args.workers, args.repeats)
+
+    columns = list(PARAM_GRID) + ['leader_f1', 'meat_machine_f1', 'normal_f1', 'macro_f1', 'runtime']
+    pareto = results[results['pareto']].sort_values('runtime')
+    print("\n检测质量与运行时间的帕累托前沿:")
+    print(pareto[columns].to_string(index=False))
+
+    production = results[results['production']].iloc[0]
+    print("\n生产环境参数:")
+    print(production[columns].to_string())
+    dominating = results[
+        (results['macro_f1'] >= production['macro_f1']) &
+        (results['runtime'] <= production['runtime']) &
+        ((results['macro_f1'] > production['macro_f1']) | (results['runtime'] < production['runtime']))
+    ]
+    if dominating.empty:
+        print("生产环境参数位于帕累托前沿上")
+    else:
+        print(f"有{len(dominating)}组参数在检测质量和运行时间上均不劣于生产环境参数:")
+        print(dominating.sort_values('macro_f1', ascending=False)[columns].to_string(index=False))
+
+    # 保存评估结果
+    sweep_id = result_store.new_run_id()
+    db_path = os.path.join(RESULT_DIR, 'results.db')
+    conn = result_store.connect(db_path)
+    try:
+        result_store.save_sweep(conn, sweep_id, results)
+    finally:
+        conn.close()
+    print(f"\n参数评估结果已写入{db_path} (sweep_id={sweep_id})")
+
+
+if __name__ == "__main__":
+    main()
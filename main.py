@@ -16,8 +16,10 @@ def run_step(step_name, module_name):
             import generate_data
         elif module_name == "analyze_groups":
             import analyze_groups
+            analyze_groups.main()
         elif module_name == "visualize_results":
             import visualize_results
+            visualize_results.main()
         print(f"\n{step_name}执行完成!")
         return True
     except Exception as e:
@@ -47,9 +49,7 @@ def main():
         return
     
     # 检查是否需要重新生成数据
-    regenerate = False
-    if len(sys.argv) > 1 and sys.argv[1] == "--regenerate":
-        regenerate = True
+    regenerate = "--regenerate" in sys.argv[1:]
     
     # 步骤1: 生成数据
     data_path = "/mnt/ymj/vivo/群控/data/device_data.csv"
@@ -70,9 +70,10 @@ def main():
     print_header("分析完成")
     result_dir = "/mnt/ymj/vivo/群控/result"
     print("分析结果文件:")
-    print(f"  - {result_dir}/suspicious_devices.csv: 可疑设备数据")
-    print(f"  - {result_dir}/group_leaders.csv: 团伙领导者信息")
-    print(f"  - {result_dir}/group_analysis.csv: 团伙规模和交易特征")
+    print(f"  - {result_dir}/results.db: 分析结果数据库 (SQLite，按run_id区分每次运行)")
+    print("      suspicious_devices: 可疑设备数据")
+    print("      v_group_leaders: 团伙领导者信息")
+    print("      group_analysis: 团伙规模和交易特征")
     print("\n可视化结果:")
     print(f"  - {result_dir}/cluster_analysis.png: 聚类分析图")
     print(f"  - {result_dir}/visualization/: 详细可视化结果目录")
@@ -0,0 +1,228 @@
+import os
+import sqlite3
+from datetime import datetime
+from itertools import islice
+
+import pandas as pd
+
+# 结果数据库路径
+RESULT_DIR = "/mnt/ymj/vivo/群控/result"
+DB_PATH = os.path.join(RESULT_DIR, 'results.db')
+
+# 每批写入的行数
+BATCH_SIZE = 5000
+
+DEVICE_COLUMNS = ['imei', 'ip', 'subnet', 'screen_time', 'trade_freq', 'trade_amount',
+                  'app_switches', 'role', 'cluster', 'group_type', 'ip_count', 'is_leader', 'gang']
+GROUP_COLUMNS = ['ip', 'trade_freq', 'trade_amount', 'group_size']
+SWEEP_COLUMNS = ['subnet_threshold', 'ip_share_min', 'n_clusters', 'freq_tolerance', 'leader_min_ips',
+                 'leader_precision', 'leader_recall', 'leader_f1',
+                 'meat_machine_precision', 'meat_machine_recall', 'meat_machine_f1',
+                 'normal_precision', 'normal_recall', 'normal_f1',
+                 'macro_f1', 'runtime', 'pareto', 'production']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    created_at TEXT NOT NULL,
+    n_devices INTEGER,
+    clustering_mode TEXT
+);
+
+CREATE TABLE IF NOT EXISTS suspicious_devices (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    imei TEXT NOT NULL,
+    ip TEXT,
+    subnet TEXT,
+    screen_time REAL,
+    trade_freq REAL,
+    trade_amount REAL,
+    app_switches REAL,
+    role TEXT,
+    cluster INTEGER,
+    group_type TEXT,
+    ip_count INTEGER,
+    is_leader INTEGER NOT NULL DEFAULT 0,
+    gang TEXT
+);
+-- 过滤列在前，跨run查询 (如 WHERE imei = ?) 和单个run内查询 (WHERE subnet = ? AND run_id = ?) 都能用上索引
+DROP INDEX IF EXISTS idx_devices_imei;
+DROP INDEX IF EXISTS idx_devices_ip;
+DROP INDEX IF EXISTS idx_devices_subnet;
+DROP INDEX IF EXISTS idx_devices_cluster;
+DROP INDEX IF EXISTS idx_devices_group_type;
+CREATE INDEX IF NOT EXISTS idx_devices_run ON suspicious_devices(run_id);
+CREATE INDEX IF NOT EXISTS idx_devices_imei_run ON suspicious_devices(imei, run_id);
+CREATE INDEX IF NOT EXISTS idx_devices_ip_run ON suspicious_devices(ip, run_id);
+CREATE INDEX IF NOT EXISTS idx_devices_subnet_run ON suspicious_devices(subnet, run_id);
+CREATE INDEX IF NOT EXISTS idx_devices_cluster_run ON suspicious_devices(cluster, run_id);
+CREATE INDEX IF NOT EXISTS idx_devices_group_type_run ON suspicious_devices(group_type, run_id);
+
+CREATE TABLE IF NOT EXISTS group_analysis (
+    run_id TEXT NOT NULL REFERENCES runs(run_id),
+    ip TEXT NOT NULL,
+    trade_freq REAL,
+    trade_amount REAL,
+    group_size INTEGER
+);
+DROP INDEX IF EXISTS idx_groups_ip;
+CREATE INDEX IF NOT EXISTS idx_groups_run ON group_analysis(run_id);
+CREATE INDEX IF NOT EXISTS idx_groups_ip_run ON group_analysis(ip, run_id);
+
+CREATE TABLE IF NOT EXISTS detection_sweep (
+    sweep_id TEXT NOT NULL,
+    subnet_threshold INTEGER,
+    ip_share_min INTEGER,
+    n_clusters INTEGER,
+    freq_tolerance REAL,
+    leader_min_ips INTEGER,
+    leader_precision REAL,
+    leader_recall REAL,
+    leader_f1 REAL,
+    meat_machine_precision REAL,
+    meat_machine_recall REAL,
+    meat_machine_f1 REAL,
+    normal_precision REAL,
+    normal_recall REAL,
+    normal_f1 REAL,
+    macro_f1 REAL,
+    runtime REAL,
+    pareto INTEGER,
+    production INTEGER
+);
+CREATE INDEX IF NOT EXISTS idx_sweep_id ON detection_sweep(sweep_id);
+
+-- 团伙leader
+CREATE VIEW IF NOT EXISTS v_group_leaders AS
+SELECT * FROM suspicious_devices WHERE is_leader = 1;
+
+-- 各聚类的设备数量和特征平均值
+CREATE VIEW IF NOT EXISTS v_cluster_summary AS
+SELECT run_id, cluster, COUNT(*) AS device_count,
+       AVG(screen_time) AS screen_time, AVG(trade_freq) AS trade_freq,
+       AVG(trade_amount) AS trade_amount, AVG(app_switches) AS app_switches
+FROM suspicious_devices GROUP BY run_id, cluster;
+
+-- 各类型的设备数量
+CREATE VIEW IF NOT EXISTS v_group_type_counts AS
+SELECT run_id, group_type, COUNT(*) AS device_count
+FROM suspicious_devices GROUP BY run_id, group_type;
+
+-- 各子网的可疑设备数量
+CREATE VIEW IF NOT EXISTS v_subnet_summary AS
+SELECT run_id, subnet, COUNT(*) AS device_count, SUM(is_leader) AS leader_count,
+       AVG(trade_freq) AS trade_freq, AVG(trade_amount) AS trade_amount
+FROM suspicious_devices GROUP BY run_id, subnet;
+
+-- 按规模分档的团伙交易特征
+CREATE VIEW IF NOT EXISTS v_group_size_category AS
+SELECT run_id, ip, trade_freq, trade_amount, group_size,
+       CASE WHEN group_size <= 5 THEN '1-5'
+            WHEN group_size <= 10 THEN '6-10'
+            WHEN group_size <= 20 THEN '11-20'
+            WHEN group_size <= 50 THEN '21-50'
+            WHEN group_size <= 100 THEN '51-100'
+            ELSE '>100' END AS size_category
+FROM group_analysis;
+
+-- 报告汇总指标
+CREATE VIEW IF NOT EXISTS v_run_summary AS
+SELECT r.run_id, r.created_at, r.n_devices,
+       (SELECT COUNT(*) FROM suspicious_devices d WHERE d.run_id = r.run_id) AS suspicious_count,
+       (SELECT COUNT(*) FROM suspicious_devices d WHERE d.run_id = r.run_id AND d.is_leader = 1) AS leader_count,
+       (SELECT COUNT(*) FROM group_analysis g WHERE g.run_id = r.run_id) AS group_count,
+       (SELECT MAX(group_size) FROM group_analysis g WHERE g.run_id = r.run_id) AS max_group_size
+FROM runs r;
+"""
+
+# 旧版本数据库中缺少的列，以及依赖这些列的索引和视图
+ADDED_COLUMNS = [
+    ('runs', 'clustering_mode', 'TEXT'),
+    ('suspicious_devices', 'gang', 'TEXT'),
+]
+
+GANG_SCHEMA = """
+DROP INDEX IF EXISTS idx_devices_gang;
+CREATE INDEX IF NOT EXISTS idx_devices_gang_run ON suspicious_devices(gang, run_id);
+
+-- 各团伙的规模和leader候选数量
+CREATE VIEW IF NOT EXISTS v_gang_summary AS
+SELECT run_id, gang, COUNT(*) AS gang_size,
+       SUM(group_type = '重大leader') AS leader_candidates, SUM(is_leader) AS leader_count,
+       AVG(trade_freq) AS trade_freq, AVG(trade_amount) AS trade_amount
+FROM suspicious_devices GROUP BY run_id, gang;
+"""
+
+
+def connect(db_path=DB_PATH):
+    """打开结果数据库(WAL模式)并确保表结构存在"""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    for table, column, column_type in ADDED_COLUMNS:
+        if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+            conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    conn.executescript(GANG_SCHEMA)
+    return conn
+
+
+def new_run_id():
+    """生成本次分析的run_id"""
+    return datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+
+
+def _bulk_insert(conn, table, columns, rows):
+    """分批executemany写入"""
+    sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        conn.executemany(sql, batch)
+
+
+def save_run(conn, run_id, n_devices, suspicious_devices, leaders, group_stats, clustering_mode='global'):
+    """在一个事务中写入一次分析的全部结果，同一run_id重复写入时覆盖旧结果"""
+    devices = suspicious_devices.copy()
+    devices['imei'] = devices['imei'].astype(str)
+    devices['is_leader'] = devices.index.isin(leaders.index).astype(int)
+    # role等仅用于验证的列在真实数据中可能不存在，缺失的列和缺失值写入NULL
+    devices = devices.reindex(columns=DEVICE_COLUMNS)
+    devices = devices.astype(object).where(devices.notna(), None)
+    device_rows = ((run_id,) + row for row in devices.itertuples(index=False, name=None))
+    group_rows = ((run_id,) + row for row in group_stats[GROUP_COLUMNS].itertuples(index=False, name=None))
+
+    with conn:
+        conn.execute("DELETE FROM suspicious_devices WHERE run_id = ?", (run_id,))
+        conn.execute("DELETE FROM group_analysis WHERE run_id = ?", (run_id,))
+        conn.execute("INSERT OR REPLACE INTO runs (run_id, created_at, n_devices, clustering_mode) VALUES (?, ?, ?, ?)",
+                     (run_id, datetime.now().isoformat(timespec='seconds'), int(n_devices), clustering_mode))
+        _bulk_insert(conn, 'suspicious_devices', ['run_id'] + DEVICE_COLUMNS, device_rows)
+        _bulk_insert(conn, 'group_analysis', ['run_id'] + GROUP_COLUMNS, group_rows)
+
+
+def save_sweep(conn, sweep_id, results):
+    """在一个事务中写入一次参数评估的全部结果"""
+    rows = ((sweep_id,) + row for row in results[SWEEP_COLUMNS].itertuples(index=False, name=None))
+    with conn:
+        conn.execute("DELETE FROM detection_sweep WHERE sweep_id = ?", (sweep_id,))
+        _bulk_insert(conn, 'detection_sweep', ['sweep_id'] + SWEEP_COLUMNS, rows)
+
+
+def latest_run_id(conn):
+    """返回最近一次分析的run_id，没有结果时返回None"""
+    row = conn.execute("SELECT run_id FROM runs ORDER BY created_at DESC, run_id DESC LIMIT 1").fetchone()
+    return row[0] if row else None
+
+
+def read_view(conn, view, run_id, columns='*', limit=None, order_by=None):
+    """读取指定run_id下某个表或视图的数据，order_by为排序子句，如 'trade_amount DESC'"""
+    sql = f"SELECT {columns} FROM {view} WHERE run_id = ?"
+    if order_by is not None:
+        sql += f" ORDER BY {order_by}"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    return pd.read_sql_query(sql, conn, params=(run_id,))
@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.cluster import KMeans
+from sklearn.preprocessing import StandardScaler
+
+import detection
+import evaluate_detection
+
+DATA_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'device_data.csv')
+
+
+def test_suspicious_masks_skip_missing_codes():
+    subnet_codes, _ = pd.factorize(pd.Series(['a', 'a', 'a', None, None, None]))
+    ip_codes, _ = pd.factorize(pd.Series([None, None, '1.1.1.1', '1.1.1.1', None, '2.2.2.2']))
+    subnet_mask, ip_mask = detection.suspicious_masks(subnet_codes, ip_codes, subnet_threshold=2, ip_share_min=2)
+    # 缺失的子网和IP不会被当作同一个分组
+    assert subnet_mask.tolist() == [True, True, True, False, False, False]
+    assert ip_mask.tolist() == [False, False, True, True, False, False]
+
+
+def test_suspicious_devices_mask_drops_duplicates_and_missing_keys():
+    df = pd.DataFrame({
+        'imei': ['1', '1', '2', '3', '4'],
+        'ip': ['1.1.1.1', '1.1.1.1', '1.1.1.1', np.nan, np.nan],
+        'subnet': ['1.1.1', '1.1.1', '1.1.1', np.nan, np.nan],
+    })
+    suspicious, subnet_mask = detection.suspicious_devices_mask(df, subnet_threshold=2, ip_share_min=2)
+    assert suspicious.tolist() == [True, False, True, False, False]
+    assert subnet_mask.tolist() == [True, True, True, False, False]
+
+
+def test_device_ip_counts_ignores_missing_codes():
+    imei_codes = np.array([0, 0, 0, 1, -1, 2])
+    ip_codes = np.array([0, 1, 1, 1, 0, -1])
+    assert detection.device_ip_counts(imei_codes, ip_codes).tolist() == [2, 2, 2, 1, 0, 0]
+
+
+def test_gang_keys_pools_small_gangs():
+    subnets = np.array(['a'] * 3 + ['b'] * 2)
+    ips = np.array(['a.1', 'a.2', 'a.3', 'b.1', 'b.1'])
+    in_subnet = np.array([True, True, True, False, False])
+    assert detection.gang_keys(subnets, ips, in_subnet, min_size=3).tolist() == ['a'] * 3 + [detection.OTHER_GANG] * 2
+
+
+def test_identify_cluster_types():
+    # 三个聚类的交易频率均值为2/12/13，交易金额均值为10000/300/300
+    X = np.array([
+        [1, 2, 10000, 10],
+        [5, 12, 300, 70],
+        [5, 13, 300, 70],
+    ], dtype=float)
+    types = detection.identify_cluster_types(X, np.array([0, 1, 2]), freq_tolerance=2)
+    assert types.tolist() == [detection.LEADER, detection.MEAT_MACHINE, detection.MEAT_MACHINE]
+
+
+def _baseline_group_types(df):
+    """重新实现重构前analyze_groups.py的可疑设备筛选和设备类型判定"""
+    subnet_counts = df.groupby('subnet')['imei'].count()
+    suspicious_subnets = subnet_counts[subnet_counts > 20].index
+    ip_groups = df.groupby('ip')['imei'].count()
+    suspicious_ips = ip_groups[ip_groups > 1].index
+    suspicious = pd.concat([df[df['subnet'].isin(suspicious_subnets)],
+                            df[df['ip'].isin(suspicious_ips)]]).drop_duplicates()
+
+    X_scaled = StandardScaler().fit_transform(suspicious[detection.FEATURES].values)
+    suspicious['cluster'] = KMeans(n_clusters=3, random_state=42, n_init=10).fit_predict(X_scaled)
+    cluster_stats = suspicious.groupby('cluster')[detection.FEATURES].mean()
+
+    def identify_cluster_type(row):
+        if row['trade_freq'] < cluster_stats['trade_freq'].mean() and row['trade_amount'] > cluster_stats['trade_amount'].mean():
+            return "重大leader"
+        elif abs(row['trade_freq'] - cluster_stats['trade_freq'].median()) < 2 and row['trade_amount'] < cluster_stats['trade_amount'].mean():
+            return "肉机"
+        else:
+            return "误差项"
+
+    return suspicious.apply(identify_cluster_type, axis=1)
+
+
+@pytest.mark.skipif(not os.path.exists(DATA_PATH), reason="缺少data/device_data.csv")
+def test_global_mode_matches_baseline_group_types():
+    df = pd.read_csv(DATA_PATH)
+    expected = _baseline_group_types(df)
+
+    suspicious_mask, _ = detection.suspicious_devices_mask(df)
+    suspicious = df[suspicious_mask]
+    X = suspicious[detection.FEATURES].values
+    group_types = pd.Series(detection.identify_cluster_types(X, detection.cluster_features(X)), index=suspicious.index)
+
+    assert sorted(group_types.index) == sorted(expected.index)
+    assert (group_types == expected.reindex(group_types.index)).all()
+
+
+def test_role_scores():
+    L, M, N = evaluate_detection.LEADER, evaluate_detection.MEAT_MACHINE, evaluate_detection.NORMAL
+    truth = np.array([L, L, M, M, N])
+    predicted = np.array([L, N, M, M, M])
+    scores = evaluate_detection.role_scores(truth, predicted)
+    assert scores['leader_precision'] == 1.0 and scores['leader_recall'] == 0.5
+    assert scores['meat_machine_precision'] == pytest.approx(2 / 3) and scores['meat_machine_recall'] == 1.0
+    assert scores['normal_f1'] == 0.0
+    assert scores['macro_f1'] == pytest.approx((2 / 3 + 0.8 + 0.0) / 3)
+
+
+def test_mark_pareto():
+    results = pd.DataFrame({
+        'macro_f1': [0.5, 0.7, 0.6, 0.9, 0.9, 0.4],
+        'runtime':  [1.0, 2.0, 3.0, 4.0, 5.0, 0.5],
+    })
+    marked = evaluate_detection.mark_pareto(results)
+    # 0.6@3s被0.7@2s支配，0.9@5s被0.9@4s支配
+    assert marked['pareto'].tolist() == [True, True, False, True, False, True]
+
+
+def _separated_gangs(rng, gang_sizes):
+    """每个团伙由3个相距很远的簇组成，各团伙的特征尺度不同"""
+    blocks, truth = [], []
+    for size in gang_sizes:
+        labels = np.arange(size) % 3
+        centers = rng.uniform(0, 10, size=(1, 4)) + np.array([[0, 0, 0, 0], [100, 0, 100, 0], [0, 100, 0, 100]])
+        blocks.append((centers[labels] + rng.normal(scale=0.01, size=(size, 4))) * rng.uniform(0.5, 3, size=4))
+        truth.append(labels)
+    return np.concatenate(blocks), truth
+
+
+def test_batched_kmeans_recovers_each_gang():
+    rng = np.random.default_rng(0)
+    sizes = [30, 60, 9]
+    X, truth = _separated_gangs(rng, sizes)
+    counts = np.array(sizes)
+    labels = detection._batched_kmeans(X, counts, rng.random((len(sizes), 3, 3)), n_clusters=3, n_init=3)
+    for gang_labels, gang_truth in zip(np.split(labels, np.cumsum(counts)[:-1]), truth):
+        # 聚类编号可以互换，但团伙内的划分必须与真实簇一致
+        assert len(set(zip(gang_labels, gang_truth))) == 3
+
+
+def test_identify_types_by_gang_matches_per_gang_rules():
+    rng = np.random.default_rng(1)
+    sizes = [20, 35]
+    X = rng.uniform(1, 100, size=(sum(sizes), 4))
+    labels = rng.integers(0, 3, size=len(X))
+    types = detection._identify_types_by_gang(X, np.array(sizes), labels, n_clusters=3, freq_tolerance=2)
+    expected = [detection.identify_cluster_types(X[part], labels[part], freq_tolerance=2)
+                for part in np.split(np.arange(len(X)), np.cumsum(sizes)[:-1])]
+    assert types.tolist() == np.concatenate(expected).tolist()
+
+
+def test_cluster_by_gang_independent_of_workers():
+    rng = np.random.default_rng(2)
+    X, _ = _separated_gangs(rng, [40, 2, 25, 50])
+    gangs = np.repeat(['b', 'd', 'a', 'c'], [40, 2, 25, 50]).astype(object)
+    serial_labels, serial_types = detection.cluster_by_gang(X, gangs, workers=1)
+    parallel_labels, parallel_types = detection.cluster_by_gang(X, gangs, workers=2)
+    assert serial_labels.tolist() == parallel_labels.tolist()
+    assert serial_types.tolist() == parallel_types.tolist()
+    # 设备数不足聚类数的团伙全部记为误差项，各团伙的聚类编号互不重叠
+    assert set(serial_types[gangs == 'd']) == {detection.NOISE}
+    assert all(set(serial_labels[gangs == a]).isdisjoint(serial_labels[gangs == b]) for a, b in [('a', 'b'), ('b', 'c'), ('a', 'c')])
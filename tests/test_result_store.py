@@ -0,0 +1,42 @@
+import pandas as pd
+
+import result_store
+
+
+def _devices(**extra):
+    df = pd.DataFrame({
+        'imei': [1, 2, 3],
+        'ip': ['1.1.1.1', '1.1.1.1', '1.1.1.2'],
+        'subnet': ['1.1.1'] * 3,
+        'screen_time': [1.0, 5.0, 6.0],
+        'trade_freq': [2.0, 12.0, 13.0],
+        'trade_amount': [10000.0, 300.0, 200.0],
+        'app_switches': [10.0, 70.0, 80.0],
+        'cluster': [0, 1, 1],
+        'group_type': ['重大leader', '肉机', '肉机'],
+        'ip_count': [2, 1, 1],
+        'gang': ['1.1.1'] * 3,
+    })
+    return df.assign(**extra)
+
+
+def test_save_run_without_role_column(tmp_path):
+    conn = result_store.connect(str(tmp_path / 'results.db'))
+    devices = _devices()
+    group_stats = pd.DataFrame({'ip': ['1.1.1.1'], 'trade_freq': [7.0], 'trade_amount': [5150.0], 'group_size': [2]})
+    result_store.save_run(conn, 'r1', 10, devices, devices.iloc[:1], group_stats)
+
+    stored = result_store.read_view(conn, 'suspicious_devices', 'r1', columns='imei, role, is_leader')
+    assert stored['imei'].tolist() == ['1', '2', '3']
+    assert stored['role'].isna().all()
+    assert stored['is_leader'].tolist() == [1, 0, 0]
+
+    summary = result_store.read_view(conn, 'v_run_summary', 'r1').iloc[0]
+    assert (summary['suspicious_count'], summary['leader_count'], summary['max_group_size']) == (3, 1, 2)
+
+
+def test_cross_run_lookups_use_indexes(tmp_path):
+    conn = result_store.connect(str(tmp_path / 'results.db'))
+    for column in ['imei', 'ip', 'subnet', 'cluster', 'group_type', 'gang']:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT * FROM suspicious_devices WHERE {column} = ?", ('x',)).fetchall()
+        assert 'USING INDEX' in plan[0][3], (column, plan)